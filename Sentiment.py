@@ -1,54 +1,317 @@
 # app.pyF
 
+import asyncio
+import calendar
+import enum
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
 import streamlit as st
 import feedparser
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
+import typing_extensions
+from diskcache import Cache, ENOVAL
+from lxml import etree
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta, timezone
 
+from feeds import parse_xml_entries
+
 # --- Core Functions ---
 
-def check_article_relevance(headline, keywords, model):
+@st.cache_resource(show_spinner=False)
+def get_feed_store():
+    """
+    Keeps the last full parse of each feed URL, shared by every session.
+    parse_feed uses its etag/modified when its own cache has expired, so an
+    unchanged feed is answered with a 304 and the stored entries are reused.
+    """
+    return {}
+
+
+@st.cache_data(ttl=900, show_spinner=False)
+def parse_feed(feed_url):
     """
-    Uses Gemini to determine if a headline is relevant to a list of user-defined keywords.
+    Downloads and parses a single RSS/Atom feed. Safe to run in a worker thread.
+    The result is cached on the URL alone; when that expires, the request is
+    made conditional on the last full parse, and a 304 reuses its entries.
+
+    Well-formed RSS and Atom feeds are read directly with lxml, which is far
+    quicker than feedparser; anything else falls back to feedparser.
     """
+    feed_store = get_feed_store()
+    previous = feed_store.get(feed_url)
+
+    # Some sites block the default python-requests User-Agent, so identify as feedparser did
+    headers = {"User-Agent": feedparser.USER_AGENT}
+    if previous is not None:
+        if previous["etag"]:
+            headers["If-None-Match"] = previous["etag"]
+        if previous["modified"]:
+            headers["If-Modified-Since"] = previous["modified"]
+
+    response = requests.get(feed_url, headers=headers, timeout=10)
+    if response.status_code == 304 and previous is not None:
+        return previous
+    response.raise_for_status()
+
     try:
-        # Create a comma-separated string of keywords for the prompt
-        keyword_str = ", ".join(keywords)
-        
-        prompt = f"""
-        Analyse the following headline and determine if it is directly about or related to any of these topics: {keyword_str}.
+        entries = parse_xml_entries(response.content)
+    except (etree.XMLSyntaxError, ValueError):
+        d = feedparser.parse(response.content)
+        entries = [
+            {"title": entry.get("title"), "link": entry.get("link"), "published_parsed": entry.get("published_parsed")}
+            for entry in d.entries
+        ]
+
+    d = {
+        "status": response.status_code,
+        "etag": response.headers.get("ETag"),
+        "modified": response.headers.get("Last-Modified"),
+        "entries": entries,
+    }
+    feed_store[feed_url] = d
+    return d
+
+
+@st.cache_resource(show_spinner=False)
+def build_keyword_matcher(keywords):
+    """
+    Compiles the keywords into one case-insensitive regex, so each headline can
+    be checked for every keyword in a single search. Compiled patterns are
+    thread-safe, so one is shared by every rerun and session using the same keywords.
+    """
+    # Longest first, so "interest rates" wins over "interest" at the same position
+    alternatives = "|".join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True))
+    # Only match whole words, so "AI" doesn't match "said"
+    pattern = re.compile(rf"(?<!\w)(?:{alternatives})(?!\w)", re.IGNORECASE)
+    return pattern, {keyword.lower(): keyword for keyword in keywords}
+
+
+def find_keyword(headline, matcher):
+    """Returns the first keyword mentioned by name in the headline, or None."""
+    pattern, keywords_by_lower = matcher
+    match = pattern.search(headline)
+    if not match:
+        return None
+    return keywords_by_lower.get(match.group(0).lower())
+
+
+class Sentiment(enum.Enum):
+    POSITIVE = "Positive"
+    NEGATIVE = "Negative"
+    NEUTRAL = "Neutral"
+    NA = "NA"
+
+
+# Gemini is constrained to this schema, so its answer always parses and the
+# sentiment is always one of the Sentiment values.
+class HeadlineResult(typing_extensions.TypedDict):
+    id: int
+    topic: str
+    sentiment: Sentiment
+
+
+BATCH_SIZE = 50
+# Maximum number of Gemini requests in flight at once, to stay inside the API rate limit
+MAX_CONCURRENT_REQUESTS = 50
+
+JSON_DECODER = json.JSONDecoder()
+
+# Filled in with the keywords and a JSON array of {"id", "headline"} items
+BATCH_PROMPT = """
+    You will be given a JSON array of news headlines, each with an "id".
+    For each headline, decide if it is directly about or related to any of these topics: {keywords}.
+    Some headlines have a "mentions" field with a topic they mention by name. That topic is likely, but
+    still answer "None" if the headline is about something else that shares its name.
+
+    Return a JSON array with one item per headline, using the same "id".
+    Set "topic" to the topic from the list that it is most related to, or "None" if it is not related to any of them.
+    Set "sentiment" to the sentiment of the headline strictly in relation to that topic: Positive, Negative, or Neutral.
+    If the topic is "None", set "sentiment" to "NA".
+
+    Headlines: {headlines}
+    """
+
+# Bump this whenever the way answers are interpreted changes without the
+# prompt changing, so answers cached under the old behaviour are ignored
+ANALYSIS_VERSION = 1
+
 
-        If it is related, respond with ONLY the topic from the list that it is most related to.
-        If it is not related to any of the topics, respond with ONLY the word "None".
+def _extract_json_objects(buffer):
+    """
+    Pulls every complete JSON object out of the start of a partially received
+    JSON array. Returns the objects and the unparsed remainder of the buffer,
+    which still needs more text before the next object is complete.
+    """
+    objects = []
+    position = 0
+    while True:
+        # Skip past the opening bracket and the separators between objects
+        while position < len(buffer) and buffer[position] in "[, \t\r\n":
+            position += 1
+        if position >= len(buffer) or buffer[position] == "]":
+            break
+        try:
+            obj, position = JSON_DECODER.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            break  # The next object hasn't fully arrived yet
+        objects.append(obj)
+    return objects, buffer[position:]
+
+
+async def analyze_batch(entries, keywords, model, semaphore, on_result):
+    """
+    Uses a single Gemini call to check a batch of headlines for relevance to the
+    keywords and to score the sentiment of each relevant one.
 
-        Headline: "{headline}"
-        """
-        response = model.generate_content(prompt)
-        result = response.text.strip()
+    `entries` is a list of {"id": ..., "headline": ...} dicts. Entries that
+    mention a keyword by name also carry it as "mentions", as a hint for
+    Gemini - it still decides whether the headline is really about that topic.
 
-        # If the result from Gemini is one of our keywords, it's a match.
-        if result in keywords:
-            return result # Return the matched keyword
+    The response is streamed, and `on_result(id, result)` is called for each
+    headline as soon as its part of the answer arrives. `result` is
+    {"topic": ..., "sentiment": ...} for headlines that matched a keyword, or
+    None for headlines Gemini found irrelevant.
+
+    This runs on the background event loop, where Streamlit calls aren't
+    allowed, so API errors are raised for the caller to report.
+    """
+    # Create a comma-separated string of keywords for the prompt
+    keyword_str = ", ".join(keywords)
+
+    prompt = BATCH_PROMPT.format(keywords=keyword_str, headlines=json.dumps(entries))
+
+    requested_ids = {entry["id"] for entry in entries}
+    answered_ids = set()
+    keyword_set = set(keywords)
+
+    def handle_item(item):
+        # Ignore ids we didn't ask about, and any repeats later in the stream
+        if item.get("id") not in requested_ids or item["id"] in answered_ids:
+            return
+        answered_ids.add(item["id"])
+        # Only keep items whose topic is one of our keywords
+        if item.get("topic") in keyword_set:
+            on_result(item["id"], {"topic": item["topic"], "sentiment": item.get("sentiment")})
         else:
-            return None # Return None if Gemini says "None" or something unexpected
-            
-    except Exception as e:
-        st.error(f"Gemini API Error during relevance check: {e}")
-        return None
+            on_result(item["id"], None)
+
+    async with semaphore:
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=list[HeadlineResult],
+            ),
+            stream=True,
+        )
+        buffer = ""
+        async for chunk in response:
+            # chunk.text raises on chunks without parts, such as a final one
+            # that only carries the finish reason or usage
+            if not chunk.candidates or not chunk.candidates[0].content.parts:
+                continue
+            text = "".join(part.text for part in chunk.candidates[0].content.parts)
+            objects, buffer = _extract_json_objects(buffer + text)
+            for item in objects:
+                handle_item(item)
 
+    if buffer.strip() not in ("", "]"):
+        raise ValueError(f"Incomplete JSON response from Gemini: {buffer[:100]}")
 
-def get_gemini_sentiment(headline, term, model):
-    """Performs sentiment analysis using the Gemini API."""
-    try:
-        prompt = f"""
-        Analyse the sentiment of the following headline strictly in relation to the term '{term}'. Is the headline positive, negative, or neutral about '{term}'?
-        Answer with only one word: Positive, Negative, or Neutral. Headline: "{headline}"
-        """
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        st.error(f"Gemini API Error: {e}") # Replaces print()
-        return "API Error"
+
+async def _make_async_client(api_key):
+    """Creates a Gemini client for one API key. Must run on the loop the client will be used from."""
+    return glm.GenerativeServiceAsyncClient(client_options={"api_key": api_key})
+
+
+@st.cache_resource
+def get_model(api_key, name):
+    """
+    Returns the model for an API key, reusing it (and its open connection)
+    across reruns instead of rebuilding it on every click.
+    """
+    model = genai.GenerativeModel(name)
+    # genai.configure() is process-wide, and a model only looks up its client on
+    # first use, so a cached model could end up calling with whichever key was
+    # configured last. Bind this key's own client to the model up front instead.
+    model._async_client = asyncio.run_coroutine_threadsafe(_make_async_client(api_key), get_event_loop()).result()
+    return model
+
+
+@st.cache_resource
+def get_event_loop():
+    """
+    Starts one long-lived asyncio loop in a background thread for all Gemini calls.
+    The cached model's async connection is tied to the loop it was first used on,
+    so every run has to use the same loop rather than a fresh asyncio.run().
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+def submit_batches(batches, keywords, model, results_queue):
+    """
+    Schedules every batch on the background event loop to run concurrently.
+    Each headline's (id, result) is put on `results_queue` as soon as it
+    arrives, so the caller can show it straight away. Returns a future per
+    batch, which finishes once the whole batch has been answered.
+    """
+    loop = get_event_loop()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    def on_result(i, result):
+        results_queue.put((i, result))
+
+    return [
+        asyncio.run_coroutine_threadsafe(analyze_batch(batch, keywords, model, semaphore, on_result), loop)
+        for batch in batches
+    ]
+
+
+CACHE_DIR = "./.gemini_cache"
+CACHE_EXPIRY_SECONDS = 30 * 24 * 60 * 60
+
+
+@st.cache_resource
+def get_analysis_cache():
+    """
+    Returns an on-disk store of previous Gemini answers, shared across reruns,
+    sessions and app restarts. RSS feeds republish the same headlines on every
+    reload, so most of them have already been analysed.
+    """
+    return Cache(CACHE_DIR)
+
+
+def _dedup_key(headline):
+    """Reduces a headline to lowercase letters and digits, so syndicated copies of a story compare equal."""
+    return re.sub(r"\W+", "", headline.lower())
+
+
+def _cache_scope(keywords, model_name):
+    """
+    Builds the part of the cache key shared by every headline in a run: the
+    keywords (in any order), the model name, the prompt and ANALYSIS_VERSION.
+    Changing any of those starts a fresh cache rather than reusing answers
+    given under the old settings. Computed once per run rather than once per headline.
+    """
+    return json.dumps([ANALYSIS_VERSION, BATCH_PROMPT, model_name, sorted(keywords)])
+
+
+def _cache_key(headline, scope):
+    """Builds a headline's cache key within a scope, ignoring case/whitespace in the headline."""
+    normalised_headline = " ".join(headline.lower().split())
+    return hashlib.sha256(f"{scope}\n{normalised_headline}".encode("utf-8")).hexdigest()
 
 # --- Streamlit UI and Main Application Flow ---
 
@@ -79,11 +342,7 @@ if not gemini_api_key:
 if st.button("Analyse Feeds"):
 
     try:
-        genai.configure(api_key=gemini_api_key)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-    except Exception as e:
-        st.error(f"Failed to configure Gemini API. Please check your key. Error: {e}")
-        st.stop()
+        model = get_model(gemini_api_key, 'gemini-2.5-flash')
     except Exception as e:
         st.error(f"Failed to configure Gemini API. Please check your key. Error: {e}")
         st.stop()
@@ -99,72 +358,150 @@ if st.button("Analyse Feeds"):
     # The call to expand_keywords_with_gemini is gone. We use initial_keywords directly.
     st.success(f"Checking articles for relevance against your {len(initial_keywords)} topics...")
 
-    results = []
-    two_weeks_ago = datetime.now(timezone.utc) - timedelta(days=14)
+    two_weeks_ago = int((datetime.now(timezone.utc) - timedelta(days=14)).timestamp())
 
     st.subheader("Processing Feeds...")
     status_area = st.container() 
+    results_area = st.empty()
+
+    # Fetch all feeds concurrently - this is network-bound, so total time is
+    # roughly the slowest feed rather than the sum of all of them.
+    # Streamlit isn't thread-safe, so only the main thread writes to the page.
+    parsed_feeds = {}
+    with ThreadPoolExecutor(max_workers=min(8, len(feeds))) as executor:
+        futures = {}
+        for feed_url in feeds:
+            future = executor.submit(parse_feed, feed_url)
+            futures[future] = feed_url
+
+        for future in as_completed(futures):
+            feed_url = futures[future]
+            try:
+                parsed_feeds[feed_url] = future.result()
+                status_area.write(f"Parsed feed: {feed_url}")
+            except Exception as e:
+                st.error(f"Could not parse feed {feed_url}. Error: {e}")
+
+    # Gather dated articles in the order the feeds were entered, not the order they finished
+    all_entries = [
+        entry
+        for feed_url in feeds if feed_url in parsed_feeds
+        for entry in parsed_feeds[feed_url]["entries"]
+        if entry.get("published_parsed") and entry.get("title")
+    ]
+
+    # Keep the last two weeks' articles, comparing all the timestamps in one go
+    pub_timestamps = np.fromiter(
+        (calendar.timegm(entry["published_parsed"]) for entry in all_entries),
+        dtype=np.int64,
+        count=len(all_entries),
+    )
+    recent_indices = np.flatnonzero(pub_timestamps >= two_weeks_ago)
+
+    # The same story often appears in several feeds, sometimes with different
+    # punctuation or capitalisation - keep only its first appearance
+    recent_titles = np.array([_dedup_key(all_entries[i]["title"]) for i in recent_indices], dtype=str)
+    _, first_appearances = np.unique(recent_titles, return_index=True)
+
+    recent_entries = [all_entries[i] for i in recent_indices[np.sort(first_appearances)]]
+
+    # Reuse previous answers where we have them, and only ask Gemini about the rest
+    cache = get_analysis_cache()
+    cache_scope = _cache_scope(initial_keywords, model.model_name)
+    keyword_matcher = build_keyword_matcher(tuple(initial_keywords))
+    analysis = {}
+    pending = []
+    for i, entry in enumerate(recent_entries):
+        cached = cache.get(_cache_key(entry["title"], cache_scope), ENOVAL)
+        if cached is not ENOVAL:
+            analysis[i] = cached
+            continue
+
+        item = {"id": i, "headline": entry["title"]}
+        # Point Gemini at any keyword the headline names outright
+        matched_keyword = find_keyword(entry["title"], keyword_matcher)
+        if matched_keyword:
+            item["mentions"] = matched_keyword
+        pending.append(item)
+
+    # Rows are keyed by their position in recent_entries, so the table
+    # keeps feed order however the batches finish.
+    result_columns = ["Headline", "Link", "Matched Keyword", "Sentiment", "Date"]
+    result_rows = {}
+
+    def add_results(batch_analysis):
+        """Adds the relevant articles from a batch of results to the table and redraws it."""
+        added = False
+        for i, result in batch_analysis.items():
+            if not result:
+                continue
+            entry = recent_entries[i]
+            status_area.write(f"  Found Relevant Article: '{entry['title']}' (Topic: {result['topic']})")
+            status_area.write(f"    Sentiment: {result['sentiment']}")
+            added = True
+            result_rows[i] = {
+                "Headline": entry["title"],
+                "Link": entry["link"],
+                "Matched Keyword": result["topic"],
+                "Sentiment": result["sentiment"],
+                "Date": time.strftime('%Y-%m-%d', entry["published_parsed"])
+            }
+        if not added:
+            return
 
-    for feed_url in feeds:
-        status_area.write(f"Parsing feed: {feed_url}")
-        try:
-            d = feedparser.parse(feed_url)
-            for entry in d.entries:
-                if hasattr(entry, 'published_parsed') and entry.published_parsed:
-                    pub_date = datetime(*entry.published_parsed[:6], tzinfo=timezone.utc)
-
-                    if pub_date >= two_weeks_ago:
-                        # --- NEW LOGIC STARTS HERE ---
-                        # Instead of looping through keywords, we make one call to Gemini.
-                        matched_keyword = check_article_relevance(entry.title, initial_keywords, model)
-                        
-                        if matched_keyword:
-                            # If a relevant keyword was returned, proceed with sentiment analysis
-                            st.write(f"  Found Relevant Article: '{entry.title}' (Topic: {matched_keyword})")
-                            sentiment = get_gemini_sentiment(entry.title, matched_keyword, model)
-                            st.write(f"    Sentiment: {sentiment}")
-
-                            results.append({
-                                "Headline": entry.title,
-                                "Link": entry.link,
-                                "Matched Keyword": matched_keyword,
-                                "Sentiment": sentiment,
-                                "Date": pub_date.strftime('%Y-%m-%d')
-                            })
-        except Exception as e:
-            st.error(f"Could not parse feed {feed_url}. Error: {e}")
-            
-    # 4. Display results in the app
-    st.subheader("Analysis Complete")
-    if not results:
-        st.info("No new matching articles found in the last week.")
-    else:
-        st.write(f"Found {len(results)} matching articles.")
         # Use st.dataframe to show results in a nice table
-        st.dataframe(
-            results,
+        results_area.dataframe(
+            pd.DataFrame([result_rows[i] for i in sorted(result_rows)], columns=result_columns),
             column_config={
                 "Link": st.column_config.LinkColumn("Link", display_text="🔗 Read Article")
             },
-            use_container_width=True
+            use_container_width=True,
+            hide_index=True
         )
 
+    def on_results(new_analysis):
+        """Caches results from Gemini and shows them straight away."""
+        for i, result in new_analysis.items():
+            key = _cache_key(recent_entries[i]["title"], cache_scope)
+            cache.set(key, result, expire=CACHE_EXPIRY_SECONDS)
+        add_results(new_analysis)
+
+    def drain(results_queue):
+        """Takes every result that has arrived so far off the queue."""
+        new_analysis = {}
+        while True:
+            try:
+                i, result = results_queue.get_nowait()
+            except queue.Empty:
+                return new_analysis
+            new_analysis[i] = result
+
+    # Show what we already know before waiting on Gemini
+    add_results(analysis)
+
+    # Check relevance and sentiment for many headlines per Gemini call,
+    # rather than two calls for every single headline. All batches are
+    # sent concurrently and streamed back, and each headline is shown as
+    # soon as its part of the answer arrives.
+    payloads = [pending[start:start + BATCH_SIZE] for start in range(0, len(pending), BATCH_SIZE)]
+    results_queue = queue.Queue()
+    running = set(submit_batches(payloads, initial_keywords, model, results_queue))
+    while True:
+        finished, running = wait(running, timeout=0.25, return_when=FIRST_COMPLETED)
+        # A batch's results are all queued before its future finishes, so this
+        # never misses the end of a batch
+        new_analysis = drain(results_queue)
+        if new_analysis:
+            on_results(new_analysis)
+        for future in finished:
+            if future.exception():
+                st.error(f"Gemini API Error during batch analysis: {future.exception()}")
+        if not running:
+            break
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    # 4. Display results in the app
+    st.subheader("Analysis Complete")
+    if not result_rows:
+        st.info("No new matching articles found in the last week.")
+    else:
+        st.write(f"Found {len(result_rows)} matching articles.")
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+from lxml import etree
+
+from feeds import parse_xml_entries
+
+
+def rss(items):
+    return f'<?xml version="1.0"?><rss version="2.0"><channel><title>Feed</title>{items}</channel></rss>'.encode()
+
+
+def atom(entries):
+    return f'<feed xmlns="http://www.w3.org/2005/Atom"><title>Feed</title>{entries}</feed>'.encode()
+
+
+def published(entry):
+    return time.strftime("%Y-%m-%d %H:%M", entry["published_parsed"])
+
+
+def test_rss_rfc822_pubdate_is_converted_to_utc():
+    [entry] = parse_xml_entries(rss(
+        "<item><title>A</title><link>http://a</link><pubDate>Sat, 10 Oct 2026 12:00:00 +0100</pubDate></item>"
+    ))
+    assert published(entry) == "2026-10-10 11:00"
+
+
+def test_rss_iso_pubdate_falls_back_to_a_forgiving_parser():
+    [entry] = parse_xml_entries(rss(
+        "<item><title>A</title><link>http://a</link><pubDate>2026-10-10T12:00:00Z</pubDate></item>"
+    ))
+    assert published(entry) == "2026-10-10 12:00"
+
+
+def test_rss_dc_date_is_used_without_pubdate():
+    [entry] = parse_xml_entries(rss(
+        '<item xmlns:dc="http://purl.org/dc/elements/1.1/"><title>A</title>'
+        "<dc:date>2026-10-10T12:00:00+02:00</dc:date></item>"
+    ))
+    assert published(entry) == "2026-10-10 10:00"
+
+
+@pytest.mark.parametrize("pub_date", ["not a date", "", "32 Foo 2026"])
+def test_rss_malformed_pubdate_gives_none(pub_date):
+    [entry] = parse_xml_entries(rss(f"<item><title>A</title><pubDate>{pub_date}</pubDate></item>"))
+    assert entry["published_parsed"] is None
+
+
+def test_rss_permalink_guid_is_used_without_link():
+    entries = parse_xml_entries(rss(
+        "<item><title>A</title><guid>http://a</guid></item>"
+        '<item><title>B</title><guid isPermaLink="false">id-123</guid></item>'
+    ))
+    assert [entry["link"] for entry in entries] == ["http://a", ""]
+
+
+def test_rss_title_entities_are_decoded_once_and_tags_stripped():
+    [entry] = parse_xml_entries(rss("<item><title>AT&amp;amp;T &lt;b&gt;up&lt;/b&gt;</title></item>"))
+    assert entry["title"] == "AT&T up"
+
+
+def test_atom_titles_follow_their_type():
+    entries = parse_xml_entries(atom(
+        '<entry><title type="xhtml"><div xmlns="http://www.w3.org/1999/xhtml">AT&amp;T <b>up</b></div></title></entry>'
+        '<entry><title type="html">AT&amp;amp;T &lt;b&gt;up&lt;/b&gt;</title></entry>'
+        "<entry><title>1 &lt; 2</title></entry>"
+    ))
+    assert [entry["title"] for entry in entries] == ["AT&T up", "AT&T up", "1 < 2"]
+
+
+def test_atom_alternate_link_and_published_date():
+    [entry] = parse_xml_entries(atom(
+        '<entry><title>A</title><link rel="self" href="http://self"/><link href="http://alt"/>'
+        "<updated>2026-10-11T00:00:00Z</updated><published>2026-10-10T12:00:00Z</published></entry>"
+    ))
+    assert entry["link"] == "http://alt"
+    assert published(entry) == "2026-10-10 12:00"
+
+
+def test_unrecognised_feed_type_raises_value_error():
+    with pytest.raises(ValueError):
+        parse_xml_entries(b'<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"/>')
+
+
+def test_malformed_xml_raises_syntax_error():
+    with pytest.raises(etree.XMLSyntaxError):
+        parse_xml_entries(b"<rss><channel>")